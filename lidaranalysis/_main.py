@@ -6,7 +6,6 @@
 ############################################################################################################
 import datetime as dt
 import os
-from . import avg, combine, chng, plot
 import sys
 import argparse
 
@@ -37,22 +36,77 @@ def main():
     parser.add_argument('-p', '--plot', action="store_true", default=None,
                         help="Save Plots of data to /srv/data/harvest/plots. "
                              "Location does not matter; it will plot both.")
+    parser.add_argument('--enqueue', type=str, default=None, metavar='QUEUEDIR',
+                        help="Write (location, day) tasks from start to end date into shared queue directory. "
+                             "Both locations are queued if no location is given.")
+    parser.add_argument('--worker', type=str, default=None, metavar='QUEUEDIR',
+                        help="Claim and run tasks from queue directory until it is empty.")
+    parser.add_argument('--merge', type=str, default=None, metavar='QUEUEDIR',
+                        help="Merge finished day shards from queue directory into the monthly files. "
+                             "Both locations are merged if no location is given.")
+    parser.add_argument('--calibrate', type=str, default=None, choices=['rolling', 'monthly', 'drift', 'global'],
+                        help="Build the time varying bias table (bias_table_[harv or cata].csv) from all six "
+                             "minute data. Once it exists it is used instead of the single bias and is updated "
+                             "as co-ops months are added.")
+    parser.add_argument('--daemon', action="store_true", default=None,
+                        help="Watch the raw and co-ops directories, process new days as they arrive and serve "
+                             "the newest data on http://127.0.0.1:PORT/status and /latest/<loc>?n=<rows>. "
+                             "Both locations are watched if no location is given.")
+    parser.add_argument('--port', type=int, default=8642, help="Port of the daemon HTTP endpoint.")
+    parser.add_argument('--interval', type=float, default=60,
+                        help="Seconds between daemon scans of the raw and co-ops directories.")
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="Seconds after which a claimed queue task is considered stale and run again. "
+                             "Default is 7200.")
 
     args = parser.parse_args()
-    if (not bool(args.plot)) and (not bool(args.location)):
-        parser.error('"location" is required unless plotting. ')
+    queue = args.enqueue is not None or args.worker is not None or args.merge is not None
+    if (not bool(args.plot)) and (not bool(args.location)) and not queue and not args.daemon:
+        parser.error('"location" is required unless plotting, using the work queue or running the daemon. ')
 
     loc = args.location
+    locs = ['harv', 'cata'] if loc is None else [loc]
 
     # Define directories
     datafile = os.getenv('LIDARDATAFILE', os.path.join('/', 'srv', 'data', 'harvest'))
 
+    # Subsystems are imported only by the options that use them, so quick options start fast
+    # If daemon option is called
+    if args.daemon:
+        from . import daemon
+        daemon.LidarDaemon(locs, datafile, args.out, port=args.port, interval=args.interval).run()
+        sys.exit(0)
+
+    # If work queue options are called
+    if args.enqueue is not None:
+        from . import workqueue
+        if args.oneday is not None:
+            args.start, args.end = args.oneday, args.oneday
+        if args.start is None or args.end is None:
+            parser.error('start and end dates are required to fill the queue. ')
+        workqueue.enqueue(args.enqueue, locs, args.start, args.end)
+        sys.exit(0)
+    if args.worker is not None:
+        from . import workqueue
+        timeout = workqueue.TIMEOUT if args.timeout is None else args.timeout
+        workqueue.worker(args.worker, datafile, args.out, timeout=timeout)
+        sys.exit(0)
+    if args.merge is not None:
+        from . import workqueue, combine
+        workqueue.merge(args.merge, locs, datafile, args.out)
+        if args.full:
+            for l in locs:
+                outdir = os.path.join(datafile, l, 'six_minute') if args.out is None else args.out
+                combine.combinedata(l, outdir, os.path.join(datafile, 'lidar_analysis_files'))
+        sys.exit(0)
+
     # Initialize
     write_day = True
     data_yest = None
 
     # If plotting option is called
     if args.plot is True:
+        from . import plot
         plot_dir = os.path.join(datafile, 'plots')
         datadir_harv = os.path.join(datafile, 'harv', 'six_minute')
         datadir_cata = os.path.join(datafile, 'cata', 'six_minute')
@@ -84,6 +138,7 @@ def main():
         except:
             print('Input to new last day must be a working date.')
             sys.exit(0)
+        from . import chng
         chng.chng_day(args.lastday, loc, req_filedir)
         sys.exit(0)
 
@@ -95,9 +150,18 @@ def main():
         except:
             print('Input to new coops month must be a working month.')
             sys.exit(0)
+        from . import chng
         chng.chng_coops(args.coops, loc, req_filedir)
         sys.exit(0)
 
+    # If calibrate option is called
+    if args.calibrate is not None:
+        from . import calib
+        calib.calibrate(loc, outdir, req_filedir, args.calibrate)
+        sys.exit(0)
+
+    from . import avg, combine, qc
+
     # If only one day is being run
     if args.oneday is not None:
         # Create class for averaging day
@@ -106,6 +170,7 @@ def main():
             today_class.data.to_csv(os.path.join(outdir, str(loc) + '_%s.csv' % args.oneday.strftime('%Y%m')),
                                    na_rep='NaN')  # write to file
             print('Writing Data to:', os.path.join(outdir, str(loc) + '_%s.csv' % args.oneday.strftime('%Y%m')))
+            qc.write_summary(today_class.qc_day, loc, outdir)
         print('-------------------------------------')
         if args.full:  # Combine entire dataset into one file
             combine.combinedata(loc, outdir, req_filedir)
@@ -151,6 +216,7 @@ def main():
             dayClass.data.to_csv(os.path.join(outdir, str(loc) + '_%s.csv' % curr_day.strftime('%Y%m')),
                                  na_rep='NaN')  # write to file
             print('Writing Data to:', os.path.join(outdir, str(loc) + '_%s.csv' % curr_day.strftime('%Y%m')))
+            qc.write_summary(dayClass.qc_day, loc, outdir)
             if write_day:
                 file2 = open(os.path.join(req_filedir, 'lastday_' + str(loc) + '.txt'), 'w')
                 file2.write(curr_day.strftime('%Y%m%d'))  # write last day run
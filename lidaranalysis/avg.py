@@ -6,17 +6,28 @@
 ############################################################################################################
 import numpy as np
 import pandas as pd
-from scipy import stats
 import datetime as dt
 import os, sys
 from dateutil.relativedelta import relativedelta
-from . import loading
+from . import loading, spectral, qc, calib
+
+############################################################################################################
+def skew(x):
+    """ Function for the biased sample skewness, matching scipy.stats.skew with default arguments. """
+    mean = np.mean(x)
+    d = x - mean
+    m2 = np.mean(d ** 2)
+    m3 = np.mean(d ** 3)
+    if m2 <= (np.finfo(float).resolution * mean) ** 2:  # constant data
+        return np.nan
+    return m3 / m2 ** 1.5
+
 
 ############################################################################################################
 class LidarData:
     """ This is a class for loading and analyzing lidar data from a single day. """
 
-    def __init__(self, date, loc, rawdir, outdir, coopsDir, dataYest, req_fileDir):
+    def __init__(self, date, loc, rawdir, outdir, coopsDir, dataYest, req_fileDir, dataMonth=None):
         self.date = dt.datetime.strftime(date, '%Y%m%d')
         self.td = date  # self.date in datetime
         self.yd = self.td - dt.timedelta(days=1)
@@ -26,14 +37,19 @@ class LidarData:
         self.req_fileDir = req_fileDir
         self.coopsDir = coopsDir  # Directory containing coops data
         self.dataYest = dataYest  # Data from previous day, if already loaded
+        self.dataMonth = dataMonth  # Output data of the month, if already loaded
         self.mark = True  # Mark for whether or not to write data
+        self.qc_day = None  # Daily summary of window quality flags
         self.main()  # Call averaging
 
     def main(self):
         """ Function for creating filenames and calling loading and averaging functions. """
 
-        data = loading.load_output(self.td, self.loc, self.outDir)
-        
+        if self.dataMonth is None:
+            data = loading.load_output(self.td, self.loc, self.outDir)
+        else:
+            data = self.dataMonth
+
         print('-------------------------------------')
         print('Date:            ', self.td)
         if self.dataYest is None:
@@ -41,9 +57,9 @@ class LidarData:
             if raw1 is None:
                 raw1 = pd.DataFrame()
         else:
-            raw1 = self.dataYest
-            raw1.index = raw1.index - 24*60*60
+            raw1 = self.dataYest.set_axis(self.dataYest.index - 24*60*60, axis=0)  # shifted copy, leave argument
         raw2 = loading.load_raw(self.td, self.rawDir)
+        integrity = None if raw2 is None else raw2.attrs.get('integrity')
         if raw2 is None:
             print('Data file does not exist.')
             self.mark = False  # if there is no data file do not write anything
@@ -56,6 +72,9 @@ class LidarData:
             print('Data Points:     ', len(raw['range']), '\n')
             ind = (data.index >= (self.td)) & (data.index < (self.td + dt.timedelta(days=1)))  # indicies of current day
             self.data = self.sixminavg(raw, data, ind)  # call averaging function
+            if integrity is not None:  # add integrity counters of today's raw file to the QC summary
+                for k, v in integrity.items():
+                    self.qc_day['raw_' + k] = v
             ind = raw.index > 24*60*60
             self.data_today = raw[ind]
 
@@ -66,15 +85,32 @@ class LidarData:
             timedelt = dt.timedelta(days=1)
             ind = (data.index >= self.td) & (data.index < (self.td + timedelt))  # indicies of todays data
 
-        for t in data.index[ind]:  # for all of todays data
+        times = data.index[ind]
+        spec_t, spec_r, spec_w = [], [], []  # filtered points of each window for the spectral stage
+        have = np.zeros(len(times), dtype=bool)  # windows with data
+        nraw = np.zeros(len(times), dtype=int)  # points in each window before filtering
+        bias = calib.lookup(times, self.loc, self.req_fileDir)  # bias of each window from the bias table
+        if bias is None:  # no table, use the single bias
+            try:
+                file = open(os.path.join(self.req_fileDir, 'bias_' + str(self.loc) + '.txt'), 'r')
+            except IOError:
+                print('bias_' + str(self.loc) + '.txt is required. ')
+                sys.exit(0)
+            bias = np.full(len(times), float(file.read()))
+            file.close()
+
+        ngood = np.zeros(len(times), dtype=int)  # points in each window after filtering
+        for k, t in enumerate(times):  # for all of todays data
             timedelt = dt.timedelta(minutes=3)
             t1 = ((t - timedelt) - self.yd).total_seconds()
             t2 = ((t + timedelt) - self.yd).total_seconds()
             
             # indices of the raw data in a 6 minute interval around each final data point
             ind2 = (raw.index >= t1) & (raw.index <= t2)
+            r_time = np.array(raw.index[ind2]) - t1  # time from start of interval
             r_range = np.array(raw['range'][ind2])  # range in interval
             r_rpw = np.array(raw['rpw'][ind2])  # received pulse width in interval
+            nraw[k] = len(r_range)
 
             if self.loc == 'cata':
                 m = np.median(r_range)
@@ -85,49 +121,54 @@ class LidarData:
                 mean_int = np.mean(r_range)  # find overall mean
                 ind_good = ((np.abs(r_range - mean_int)) < (5 * std_int))
 
+            r_time = r_time[ind_good]
             r_range = r_range[ind_good]
             r_rpw = r_rpw[ind_good]
-            
-            try:
-                file = open(os.path.join(self.req_fileDir, 'bias_' + str(self.loc) + '.txt'), 'r')
-            except IOError:
-                print('bias_' + str(self.loc) + '.txt is required. ')
-                sys.exit(0)
-            bias = file.read()
-            bias = float(bias)
-            file.close()
 
             l_r = len(r_range)
+            ngood[k] = l_r
             if l_r > 0:  # if there is data, add to line in finalized data
                 data.loc[t, 'l_mean'] = np.mean(r_range)
                 data.loc[t, 'l_median'] = np.median(r_range)
                 data.loc[t, 'l_std'] = np.std(r_range)
-                data.loc[t, 'l_skew'] = stats.skew(r_range)
+                data.loc[t, 'l_skew'] = skew(r_range)
                 data.loc[t, 'l_n'] = l_r
                 data.loc[t, 'l_min'] = np.min(r_range)
                 data.loc[t, 'l_max'] = np.max(r_range)
                 data.loc[t, 'l_rpw'] = np.mean(r_rpw)
                 data.loc[t, 'l_Hs'] = 4 * data.loc[t, 'l_std']
-                data.loc[t, 'l'] = -data.loc[t, 'l_mean'] + bias
+                data.loc[t, 'l'] = -data.loc[t, 'l_mean'] + bias[k]
                 if self.loc == 'harv':
                     data.loc[t, 'l_ssh'] = 20.150 - data.loc[t, 'l'] - 0.05
                     data.loc[t, 'N1_1_ssh'] = data.loc[t, 'N1_1'] - 0.05
                     data.loc[t, 'Y1_1_ssh'] = 20.150 - data.loc[t, 'Y1_1'] - 0.05
-        return data
+                spec_t.append(r_time)
+                spec_r.append(r_range)
+                spec_w.append(np.full(l_r, k))
+                have[k] = True
+
+        if have.any():  # spectra of all windows are computed together
+            wave = spectral.wavestats(np.concatenate(spec_t), np.concatenate(spec_r), np.concatenate(spec_w),
+                                      len(times))
+            for name in spectral.COLUMNS:
+                data.loc[times[have], name] = wave[name][have]
+
+        # Quality metrics of every window, including windows without data
+        starts = np.array([((t - dt.timedelta(minutes=3)) - self.yd).total_seconds() for t in times])
+        qstats = qc.windowstats(raw.index, raw['rpw'], starts, raw['backstep'])
+        qstats['q_nraw'] = nraw
+        with np.errstate(invalid='ignore', divide='ignore'):
+            qstats['q_rej'] = np.where(nraw > 0, 1 - ngood / nraw, np.nan)
+        qstats['q_flag'] = qc.flags(qstats)
+        for name in qc.COLUMNS:
+            data.loc[times, name] = qstats[name]
+        self.qc_day = qc.summary(qstats, self.td)
+        return data.reindex(columns=loading.output_names(self.loc)[1:])
 
     def createFile(self, data):
         """ Function for creating output averaging DataFrame for data to be saved in. """
-        names_cata_saved = ['time', 'A1', 'A1_t1', 'A1_t2', 'B1', 'E1', 'F1', 'L1_1', 'L1_2', 'P6', 'U1',
-                            'W1', 'l', 'l_Hs', 'l_rpw', 'l_max', 'l_mean', 'l_median', 'l_min', 'l_n', 'l_skew',
-                            'l_std']
-        names_harv_saved = ['time', 'D1', 'F1', 'L1_1', 'L1_2', 'N1_1', 'N1_1_ssh', 'N1_2', 'P6', 'U1', 'W1',
-                            'Y1_1', 'Y1_1_ssh', 'Y1_2', 'l', 'l_Hs', 'l_rpw', 'l_max', 'l_mean', 'l_median', 'l_min',
-                            'l_n', 'l_skew', 'l_ssh', 'l_std']
         timevec = []
-        if self.loc == 'harv':
-            data_new = pd.DataFrame(columns=names_harv_saved)  # create DataFrame
-        if self.loc == 'cata':
-            data_new = pd.DataFrame(columns=names_cata_saved)  # create DataFrame
+        data_new = pd.DataFrame(columns=loading.output_names(self.loc))  # create DataFrame
         if data.index.empty:  # if the csv file does not exist yet
             temp = self.td  # start with the beginning of the current date being run
             while temp < (self.td + dt.timedelta(days=1)):  # create lines every 6 minutes
@@ -159,64 +200,76 @@ class LidarData:
 
     def addcoops(self, d):
         """ Function for adding co-ops data to output files """
-        print(d.strftime('%Y'))
-        coops = loading.load_coops(d, self.loc, self.coopsDir)
-        data = loading.load_output(d, self.loc, self.outDir)
-        f_data = os.path.join(self.outDir, self.loc + '_' + d.strftime('%Y%m') + '.csv')
-        if coops is None:
-            return None
-        if self.loc == 'harv':
-            # COMBINE
-            data.loc[:, 'D1'] = coops['D1']
-            data.loc[:, 'F1'] = coops['F1']
-            data.loc[:, 'L1_1'] = coops['L1_1']
-            data.loc[:, 'L1_2'] = coops['L1_2']
-            data.loc[:, 'N1_1'] = coops['N1_1']
-            data.loc[:, 'N1_2'] = coops['N1_2']
-            data.loc[:, 'U1'] = coops['U1']
-            data.loc[:, 'Y1_1'] = coops['Y1_1']
-            data.loc[:, 'Y1_2'] = coops['Y1_2']
-            data.loc[:, 'P6'] = coops['P6']
-            data.loc[:, 'W1'] = coops['W1']
-        if self.loc == 'cata':
-            # COMBINE
-            data.loc[:, 'A1'] = coops['A1']
-            data.loc[:, 'A1_t1'] = coops['A1_t1']
-            data.loc[:, 'A1_t2'] = coops['A1_t2']
-            data.loc[:, 'B1'] = coops['B1']
-            data.loc[:, 'E1'] = coops['E1']
-            data.loc[:, 'F1'] = coops['F1']
-            data.loc[:, 'L1_1'] = coops['L1_1']
-            data.loc[:, 'L1_2'] = coops['L1_2']
-            data.loc[:, 'U1'] = coops['U1']
-            data.loc[:, 'P6'] = coops['P6']
-            data.loc[:, 'W1'] = coops['W1']
-        data.to_csv(f_data, na_rep='NaN')  # write to file
-        print('Writing output data to:', f_data[-15:])
-        print('Co-Ops Data Updated for ', str(d.month) + '/' + str(d.year))
-        print('-------------------------------------')
-        return True
+        return addcoops(d, self.loc, self.outDir, self.coopsDir, self.req_fileDir)
 
     def coops(self, tm):
         """ Function for looping through months of co-ops data files """
-        tm = str(tm)  # final day being loaded
-        try:
-            file = open(os.path.join(self.req_fileDir, 'lastcoopsmonth_' + str(self.loc) + '.txt'),
-                        'r')
-        except IOError:
-            print('lastcoopsmonth_' + str(self.loc) + '.txt is required. ')
-            sys.exit(0)
-        lm = str(file.read())  # Read last coops month updated
-        file.close()
-        lm_dt = dt.datetime(int(lm[0:4]), int(lm[4:6]), 1)
-        lm_dt = lm_dt + dt.timedelta(days=32)
-        lm_dt = dt.datetime(lm_dt.year, lm_dt.month, 1)
-        tm_dt = dt.datetime(int(tm[0:4]), int(tm[4:6]), 1)
-        while lm_dt < tm_dt:  # while current month is before final month
-            a = self.addcoops(lm_dt)
-            if a is None:
-                break
-            lm_dt = lm_dt + relativedelta(months=1)
-        file = open(os.path.join(self.req_fileDir, 'lastcoopsmonth_' + str(self.loc) + '.txt'), 'w')
-        file.write((lm_dt - relativedelta(months=1)).strftime('%Y%m'))
-        file.close()
\ No newline at end of file
+        coops(tm, self.loc, self.outDir, self.coopsDir, self.req_fileDir)
+
+
+############################################################################################################
+def addcoops(d, loc, outDir, coopsDir, req_fileDir):
+    """ Function for adding co-ops data to output files """
+    print(d.strftime('%Y'))
+    coops = loading.load_coops(d, loc, coopsDir)
+    data = loading.load_output(d, loc, outDir)
+    f_data = os.path.join(outDir, loc + '_' + d.strftime('%Y%m') + '.csv')
+    if coops is None:
+        return None
+    if loc == 'harv':
+        # COMBINE
+        data.loc[:, 'D1'] = coops['D1']
+        data.loc[:, 'F1'] = coops['F1']
+        data.loc[:, 'L1_1'] = coops['L1_1']
+        data.loc[:, 'L1_2'] = coops['L1_2']
+        data.loc[:, 'N1_1'] = coops['N1_1']
+        data.loc[:, 'N1_2'] = coops['N1_2']
+        data.loc[:, 'U1'] = coops['U1']
+        data.loc[:, 'Y1_1'] = coops['Y1_1']
+        data.loc[:, 'Y1_2'] = coops['Y1_2']
+        data.loc[:, 'P6'] = coops['P6']
+        data.loc[:, 'W1'] = coops['W1']
+    if loc == 'cata':
+        # COMBINE
+        data.loc[:, 'A1'] = coops['A1']
+        data.loc[:, 'A1_t1'] = coops['A1_t1']
+        data.loc[:, 'A1_t2'] = coops['A1_t2']
+        data.loc[:, 'B1'] = coops['B1']
+        data.loc[:, 'E1'] = coops['E1']
+        data.loc[:, 'F1'] = coops['F1']
+        data.loc[:, 'L1_1'] = coops['L1_1']
+        data.loc[:, 'L1_2'] = coops['L1_2']
+        data.loc[:, 'U1'] = coops['U1']
+        data.loc[:, 'P6'] = coops['P6']
+        data.loc[:, 'W1'] = coops['W1']
+    data.to_csv(f_data, na_rep='NaN')  # write to file
+    print('Writing output data to:', f_data[-15:])
+    calib.update(data, loc, req_fileDir)  # add month to bias table, if one is used
+    print('Co-Ops Data Updated for ', str(d.month) + '/' + str(d.year))
+    print('-------------------------------------')
+    return True
+
+
+def coops(tm, loc, outDir, coopsDir, req_fileDir):
+    """ Function for looping through months of co-ops data files """
+    tm = str(tm)  # final day being loaded
+    try:
+        file = open(os.path.join(req_fileDir, 'lastcoopsmonth_' + str(loc) + '.txt'),
+                    'r')
+    except IOError:
+        print('lastcoopsmonth_' + str(loc) + '.txt is required. ')
+        sys.exit(0)
+    lm = str(file.read())  # Read last coops month updated
+    file.close()
+    lm_dt = dt.datetime(int(lm[0:4]), int(lm[4:6]), 1)
+    lm_dt = lm_dt + dt.timedelta(days=32)
+    lm_dt = dt.datetime(lm_dt.year, lm_dt.month, 1)
+    tm_dt = dt.datetime(int(tm[0:4]), int(tm[4:6]), 1)
+    while lm_dt < tm_dt:  # while current month is before final month
+        a = addcoops(lm_dt, loc, outDir, coopsDir, req_fileDir)
+        if a is None:
+            break
+        lm_dt = lm_dt + relativedelta(months=1)
+    file = open(os.path.join(req_fileDir, 'lastcoopsmonth_' + str(loc) + '.txt'), 'w')
+    file.write((lm_dt - relativedelta(months=1)).strftime('%Y%m'))
+    file.close()
\ No newline at end of file
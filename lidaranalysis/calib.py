@@ -0,0 +1,162 @@
+import datetime as dt
+import os
+import numpy as np
+import pandas as pd
+from . import loading
+
+
+############## Time Varying Bias ###########################################################################
+# The bias table holds one row per month of the sums of the aligned LiDAR - tide gauge differences d and of
+# their times t (years since 2000). Rolling, global and drift estimates are derived from cumulative sums of
+# these, so adding a month only needs the rows of that month.
+METHODS = ['rolling', 'monthly', 'drift', 'global']
+ROLL_MONTHS = 3  # Calendar months in the centered rolling window
+MAD_FACTOR = 3.0  # Months with a MAD above this many times the median monthly MAD are not used by 'monthly'
+EPOCH = dt.datetime(2000, 1, 1)
+SUMS = ['n', 's', 'ss', 'st', 'stt', 'std']
+
+
+def gauge(loc):
+    """ Function to return the tide gauge column the LiDAR is calibrated against. """
+    return 'N1_1' if loc == 'harv' else 'A1'
+
+
+def years(index):
+    """ Function to convert a DatetimeIndex to years since EPOCH. """
+    return (pd.DatetimeIndex(index) - EPOCH).total_seconds().to_numpy() / (365.25 * 86400)
+
+
+def table_file(loc, req_fileDir):
+    """ Function to return the filename of the bias table. """
+    return os.path.join(req_fileDir, 'bias_table_' + str(loc) + '.csv')
+
+
+def month_stats(data, loc):
+    """ Function to compute the sums and robust statistics of the differences for each month in data. """
+    d = pd.to_numeric(data['l_mean'], errors='coerce') - pd.to_numeric(data[gauge(loc)], errors='coerce')
+    d = d.dropna()
+    d.index = pd.DatetimeIndex(d.index)
+    t = pd.Series(years(d.index), index=d.index)
+    month = d.index.strftime('%Y%m')
+    df = pd.DataFrame({'n': 1, 's': d, 'ss': d ** 2, 'st': t, 'stt': t ** 2, 'std': t * d, 'd': d})
+    g = df.groupby(month)
+    stats = g[SUMS].sum()
+    stats['median'] = g['d'].median()
+    stats['mad'] = 1.4826 * (df['d'] - g['d'].transform('median')).abs().groupby(month).median()
+    stats.index.name = 'month'
+    return stats
+
+
+def derive(table, method):
+    """ Function to derive the rolling, drift and chosen bias of each month from cumulative sums. """
+    if table.empty:  # no months with co-ops data yet
+        for k in ['mean', 'rolling', 't_mid', 'monthly', 'drift', 'global', 'bias', 'method']:
+            table[k] = pd.Series(dtype=object if k == 'method' else float)
+        return table
+    # Cumulative sums over every calendar month, so months without data do not join distant months
+    months = pd.period_range(pd.Period(table.index[0], 'M'), pd.Period(table.index[-1], 'M'), freq='M')
+    full = table[SUMS].reindex(months.strftime('%Y%m'), fill_value=0)
+    m = len(full)
+    c = {k: np.concatenate([[0.], np.cumsum(full[k].to_numpy(dtype=float))]) for k in SUMS}
+    i = full.index.get_indexer(table.index)
+    lo = np.clip(i - ROLL_MONTHS // 2, 0, m)
+    hi = np.clip(i + ROLL_MONTHS // 2 + 1, 0, m)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        table['mean'] = table['s'] / table['n']
+        table['rolling'] = (c['s'][hi] - c['s'][lo]) / (c['n'][hi] - c['n'][lo])
+        table['t_mid'] = table['st'] / table['n']
+    noisy = table['mad'] > MAD_FACTOR * np.nanmedian(table['mad'])
+    table['monthly'] = table['median'].where(~noisy)  # noisy months are skipped by the lookup
+    intercept, slope = drift(table)
+    table['drift'] = intercept + slope * table['t_mid']
+    table['global'] = c['s'][-1] / c['n'][-1]
+    table['bias'] = table[method]
+    table['method'] = method
+    return table
+
+
+def drift(table):
+    """ Function to fit a linear trend of the differences over all months from their sums. """
+    n, st, stt, s, std = (table[k].sum() for k in ['n', 'st', 'stt', 's', 'std'])
+    den = n * stt - st ** 2
+    if n == 0 or den == 0:
+        return s / n if n else np.nan, 0.
+    slope = (n * std - st * s) / den
+    return (s - slope * st) / n, slope
+
+
+def write_table(table, loc, req_fileDir):
+    """ Function to write the bias table. """
+    f = table_file(loc, req_fileDir)
+    table.to_csv(f, na_rep='NaN')
+    print('Bias table written to:', os.path.basename(f))
+
+
+def read_table(loc, req_fileDir):
+    """ Function to read the bias table. Returns None if it does not exist. """
+    try:
+        return pd.read_csv(table_file(loc, req_fileDir), header=0, index_col=0, dtype={'month': str})
+    except IOError:
+        return None
+
+
+def calibrate(loc, outDir, req_fileDir, method='rolling'):
+    """ Function for building the bias table from all monthly output files. """
+    print('Calibrating Bias (' + method + '):')
+    stats = []
+    for root, dirs, files in os.walk(outDir):
+        files.sort()
+        for f in files:
+            if f.startswith(loc + '_2'):
+                d = dt.datetime.strptime(f, loc + '_%Y%m.csv')
+                stats.append(month_stats(loading.load_output(d, loc, outDir), loc))
+    if not stats:
+        print('No six minute data in', outDir)
+        return None
+    stats = pd.concat(stats).sort_index()
+    if stats.empty:
+        print('No six minute data with co-ops data in', outDir)
+        return None
+    table = derive(stats, method)
+    write_table(table, loc, req_fileDir)
+    intercept, slope = drift(table)
+    print('Bias = ' + str(table['global'].iloc[-1]) + ' m, Drift = ' + str(slope) + ' m/yr')
+    print('-------------------------------------')
+    return table
+
+
+def update(data, loc, req_fileDir):
+    """ Function to replace the months in data in an existing bias table. """
+    table = read_table(loc, req_fileDir)
+    if table is None:
+        return None
+    method = read_method(table)
+    stats = month_stats(data, loc)
+    table = pd.concat([table.loc[~table.index.isin(stats.index), SUMS + ['median', 'mad']], stats]).sort_index()
+    table = derive(table, method)
+    write_table(table, loc, req_fileDir)
+    return table
+
+
+def read_method(table):
+    """ Function to return the method the bias table was built with. """
+    return table['method'].iloc[0] if 'method' in table and len(table) else 'rolling'
+
+
+def lookup(times, loc, req_fileDir):
+    """ Function to return the bias of each time from the bias table, or None if there is no table.
+
+    Biases are interpolated between month centers and held beyond the first and last month, except for
+    the drift method, which evaluates the fitted trend.
+    """
+    table = read_table(loc, req_fileDir)
+    if table is None:
+        return None
+    table = table[np.isfinite(table['bias'])]
+    if table.empty:
+        return None
+    t = years(times)
+    if read_method(table) == 'drift':
+        intercept, slope = drift(table)
+        return intercept + slope * t
+    return np.interp(t, table['t_mid'].to_numpy(), table['bias'].to_numpy())
@@ -0,0 +1,220 @@
+import datetime as dt
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+from . import avg, loading, qc
+
+
+############## Watcher Daemon ##############################################################################
+INTERVAL = 60  # Seconds between scans of the raw and co-ops directories
+PORT = 8642  # Port of the localhost HTTP endpoint
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server handling each request in a thread (http.server only has one from Python 3.7). """
+    daemon_threads = True
+
+
+class LidarDaemon:
+    """ This is a class for processing raw and co-ops files as they arrive and serving the newest data.
+
+    The month of output data, the raw data of the last processed day and the last day and co-ops month
+    files are kept in memory between scans, so each new day is averaged without reloading them. The
+    directories are polled, which works on every filesystem including network mounts.
+    """
+
+    def __init__(self, locs, datafile, outdir=None, port=PORT, interval=INTERVAL):
+        self.locs = locs
+        self.datafile = datafile
+        self.req_fileDir = os.path.join(datafile, 'lidar_analysis_files')
+        self.port = port
+        self.interval = interval
+        self.lock = threading.Lock()  # Guards the state read by the HTTP server
+        self.started = dt.datetime.utcnow()
+        self.scans = 0
+        self.state = {}
+        for loc in locs:
+            self.state[loc] = {
+                'rawDir': os.path.join(datafile, loc, 'uls'),
+                'coopsDir': os.path.join(datafile, loc, 'co-ops'),
+                'outDir': os.path.join(datafile, loc, 'six_minute') if outdir is None else outdir,
+                'lastDay': self.read_lastday(loc),
+                'lastCoops': self.read_lastcoops(loc),
+                'coopsFiles': None,  # Modification times of co-ops files at last scan
+                'dataYest': None,  # Raw data of the last processed day
+                'dataMonth': None,  # Output data of the month of the last processed day
+                'month': None,
+                'processed': None,  # Time the last day was written
+                'failed': {},  # Error of each day that could not be processed, skipped until restart
+                'error': None}
+
+    def read_lastday(self, loc):
+        """ Function to read the last day run from file. """
+        with open(os.path.join(self.req_fileDir, 'lastday_' + str(loc) + '.txt'), 'r') as f:
+            start = f.read()
+        return dt.datetime(int(start[0:4]), int(start[4:6]), int(start[6:8]))
+
+    def read_lastcoops(self, loc):
+        """ Function to read the last co-ops month run from file. """
+        with open(os.path.join(self.req_fileDir, 'lastcoopsmonth_' + str(loc) + '.txt'), 'r') as f:
+            return f.read()
+
+    def write_lastday(self, loc, d):
+        """ Function to write the last day run to file. """
+        with open(os.path.join(self.req_fileDir, 'lastday_' + str(loc) + '.txt'), 'w') as f:
+            f.write(d.strftime('%Y%m%d'))
+
+    def new_days(self, loc):
+        """ Function to find days after the last day run, up to yesterday, that have a raw file. """
+        st = self.state[loc]
+        tmp = dt.datetime.today()
+        yesterday = dt.datetime(tmp.year, tmp.month, tmp.day) - dt.timedelta(days=1)
+        days = []
+        for f in os.listdir(st['rawDir']):
+            if f.startswith('uls_') and (f.endswith('.bin.gz') or f.endswith('.bin.xz')):
+                try:
+                    d = dt.datetime.strptime(f[4:12], '%Y%m%d')
+                except ValueError:
+                    continue
+                if st['lastDay'] < d <= yesterday and d not in st['failed']:
+                    days.append(d)
+        return sorted(set(days))
+
+    def process_day(self, loc, d):
+        """ Function to average one day using the cached month and previous day. """
+        st = self.state[loc]
+        dataYest = st['dataYest'] if st['lastDay'] == d - dt.timedelta(days=1) else None
+        dataMonth = st['dataMonth'].copy() if st['month'] == d.strftime('%Y%m') else None
+        day = avg.LidarData(d, loc, st['rawDir'], st['outDir'], st['coopsDir'], dataYest, self.req_fileDir,
+                            dataMonth=dataMonth)
+        if day.mark:
+            f = os.path.join(st['outDir'], str(loc) + '_%s.csv' % d.strftime('%Y%m'))
+            day.data.to_csv(f, na_rep='NaN')
+            print('Writing Data to:', f)
+            qc.write_summary(day.qc_day, loc, st['outDir'])
+            self.write_lastday(loc, d)
+        with self.lock:
+            st['lastDay'] = d
+            st['dataYest'] = day.data_today
+            if day.mark:
+                st['dataMonth'] = day.data
+                st['month'] = d.strftime('%Y%m')
+                st['processed'] = dt.datetime.utcnow()
+
+    def coops_changed(self, loc):
+        """ Function to check whether co-ops files were added or changed since the last scan. """
+        st = self.state[loc]
+        files = {}
+        for f in os.listdir(st['coopsDir']):
+            if f.startswith(loc + '_') and f.endswith('.csv'):
+                files[f] = os.path.getmtime(os.path.join(st['coopsDir'], f))
+        changed = files != st['coopsFiles']
+        st['coopsFiles'] = files
+        return changed
+
+    def update_coops(self, loc):
+        """ Function to add new co-ops months to the output files. """
+        st = self.state[loc]
+        avg.coops(st['lastDay'].strftime('%Y%m'), loc, st['outDir'], st['coopsDir'], self.req_fileDir)
+        lastCoops = self.read_lastcoops(loc)
+        with self.lock:
+            if st['month'] is not None and st['lastCoops'] < st['month'] <= lastCoops:
+                st['dataMonth'] = None  # cached month was rewritten, reload it on next use
+                st['month'] = None
+            st['lastCoops'] = lastCoops
+
+    def scan(self):
+        """ Function to process every new day and co-ops month of all locations. """
+        for loc in self.locs:
+            st = self.state[loc]
+            try:
+                days = self.new_days(loc)
+                for d in days:
+                    try:
+                        self.process_day(loc, d)
+                    except Exception as e:  # a bad file, move past the day
+                        print('Error processing', loc, d.strftime('%Y%m%d') + ':', repr(e))
+                        with self.lock:
+                            st['failed'][d] = repr(e)
+                if self.coops_changed(loc) or days:
+                    self.update_coops(loc)
+                st['error'] = None
+            except (Exception, SystemExit) as e:  # e.g. a file still being transferred, retried next scan
+                print('Error processing', loc + ':', repr(e))
+                st['error'] = repr(e)
+        self.scans += 1
+
+    def status(self):
+        """ Function to return the daemon status as a dictionary. """
+        with self.lock:
+            out = {'started': self.started.isoformat(), 'scans': self.scans, 'interval': self.interval}
+            for loc in self.locs:
+                st = self.state[loc]
+                out[loc] = {'lastday': st['lastDay'].strftime('%Y%m%d'),
+                            'lastcoopsmonth': st['lastCoops'],
+                            'cached_month': st['month'],
+                            'processed': None if st['processed'] is None else st['processed'].isoformat(),
+                            'failed': {d.strftime('%Y%m%d'): e for d, e in sorted(st['failed'].items())},
+                            'error': st['error']}
+        return out
+
+    def latest(self, loc, n):
+        """ Function to return the last n six minute rows of the last processed day. """
+        with self.lock:
+            st = self.state[loc]
+            data = st['dataMonth']
+            end = st['lastDay'] + dt.timedelta(days=1)
+        if data is None:  # not cached, load from file
+            data = loading.load_output(st['lastDay'], loc, st['outDir'])
+        return data[data.index < end].tail(n)
+
+    def serve(self):
+        """ Function to start the localhost HTTP endpoint in a background thread. """
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split('/') if p]
+                try:
+                    if parts == ['status']:
+                        body = json.dumps(daemon.status())
+                    elif len(parts) == 2 and parts[0] == 'latest' and parts[1] in daemon.locs:
+                        n = int(parse_qs(url.query).get('n', ['10'])[0])
+                        body = daemon.latest(parts[1], n).to_json(orient='split', date_format='iso')
+                    else:
+                        self.send_error(404, 'Use /status or /latest/<loc>?n=<rows>')
+                        return
+                except Exception as e:
+                    self.send_error(500, repr(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        print('Serving on:       http://127.0.0.1:' + str(self.port))
+        return server
+
+    def run(self):
+        """ Function for scanning the directories until interrupted. """
+        server = self.serve()
+        try:
+            while True:
+                self.scan()
+                sys.stdout.flush()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            server.shutdown()
+            print('Daemon stopped.')
@@ -1,6 +1,14 @@
 import gzip, lzma, os, sys
 import numpy as np
 import pandas as pd
+from . import spectral, qc
+
+names_cata_saved = ['time', 'A1', 'A1_t1', 'A1_t2', 'B1', 'E1', 'F1', 'L1_1', 'L1_2', 'P6', 'U1',
+                    'W1', 'l', 'l_Hs', 'l_max', 'l_mean', 'l_median', 'l_min', 'l_n', 'l_rpw', 'l_skew', 'l_std']
+names_harv_saved = ['time', 'D1', 'F1', 'L1_1', 'L1_2', 'N1_1', 'N1_1_ssh', 'N1_2', 'P6', 'U1', 'W1',
+                    'Y1_1', 'Y1_1_ssh', 'Y1_2', 'l', 'l_Hs', 'l_max', 'l_mean', 'l_median', 'l_min',
+                    'l_n', 'l_rpw', 'l_skew', 'l_ssh', 'l_std']
+MAX_RANGE = 60000  # Largest possible raw range (mm)
 
 
 ############## Functions for Loading Data ############################################################
@@ -26,13 +34,9 @@ def load_gzbin(f, dtype):
             except EOFError:
                 print('File is still being transfered from LiDAR Station.')
                 sys.exit(0)
-        filesize = len(file_content)
-        data = np.frombuffer(file_content, dtype, count=filesize // 12)  # returns data from file
-        data = {'time': data['time'].astype(float) / 10000, 'range': data['range'].astype(float) / 1000,
-                'rpw': data['rpw']}  # data organization
-        data = pd.DataFrame.from_dict(data)  # creates dataframe
-        data.set_index('time', inplace=True, drop=True)  # sets index as time
+        data = decode(file_content, dtype)
         print('LiDAR Data loaded from:', f[-19:])
+        report(data.attrs['integrity'])
         return data
     else:
         return None
@@ -47,44 +51,91 @@ def load_xzbin(f, dtype):
             except EOFError:
                 print('File is still being transfered from LiDAR Station.')
                 sys.exit(0)
-        filesize = len(file_content)
-        data = np.frombuffer(file_content, dtype, count=filesize // 12)  # returns data from file
-        data = {'time': data['time'].astype(float) / 10000, 'range': data['range'].astype(float) / 1000,
-                'rpw': data['rpw']}  # data organization
-        data = pd.DataFrame.from_dict(data)  # creates dataframe
-        data.set_index('time', inplace=True, drop=True)  # sets index as time
+        data = decode(file_content, dtype)
         print('LiDAR Data loaded from:', f[-19:])
+        report(data.attrs['integrity'])
         return data
     else:
         return None
 
 
+def decode(file_content, dtype):
+    """ Function to decode raw records, repairing them with whole array operations.
+
+    Records with impossible ranges are dropped, out of order records are sorted and repeated records are
+    dropped. Counts of each are stored in data.attrs['integrity']. The backstep column marks records whose
+    time stepped backwards in the file, so the windows they fall in can still be flagged after sorting.
+    Ticks count 1e-4 s from the start of the day and cannot wrap within a day (8.64e8 < 2**32), so a
+    backward jump of more than half the counter range is counted as a wrap but only sorted like any other
+    backward step.
+    """
+    filesize = len(file_content)
+    data = np.frombuffer(file_content, dtype, count=filesize // 12)  # returns data from file
+    integrity = {'records': len(data), 'partial_bytes': filesize % 12}
+
+    ticks = data['time'].astype(np.int64)
+    integrity['wraps'] = int(np.count_nonzero(np.diff(ticks) < -2 ** 31))
+
+    bad = (data['range'] == 0) | (data['range'] > MAX_RANGE)
+    integrity['bad_range'] = int(np.count_nonzero(bad))
+    if integrity['bad_range']:
+        data, ticks = data[~bad], ticks[~bad]
+
+    backstep = np.zeros(len(ticks), dtype=bool)  # also right when no records are left
+    backstep[1:] = np.diff(ticks) < 0
+    integrity['unsorted'] = int(np.count_nonzero(backstep))
+    if integrity['unsorted']:
+        order = np.argsort(ticks, kind='stable')
+        data, ticks, backstep = data[order], ticks[order], backstep[order]
+
+    dup = (np.diff(ticks) == 0) & (data['range'][1:] == data['range'][:-1]) & (data['rpw'][1:] == data['rpw'][:-1])
+    integrity['duplicates'] = int(np.count_nonzero(dup))
+    if integrity['duplicates']:
+        keep = np.concatenate([[True], ~dup])
+        backstep = np.bincount(np.cumsum(keep) - 1, weights=backstep) > 0  # kept record inherits its repeats
+        data, ticks = data[keep], ticks[keep]
+    integrity['kept'] = len(data)
+
+    data = {'time': ticks.astype(float) / 10000, 'range': data['range'].astype(float) / 1000,
+            'rpw': data['rpw'], 'backstep': backstep}  # data organization
+    data = pd.DataFrame.from_dict(data)  # creates dataframe
+    data.set_index('time', inplace=True, drop=True)  # sets index as time
+    data.attrs['integrity'] = integrity
+    return data
+
+
+def report(integrity):
+    """ Function to print the integrity counters of a raw file if anything was repaired. """
+    problems = {k: v for k, v in integrity.items() if k not in ('records', 'kept') and v}
+    if problems:
+        print('Repaired Records:', ', '.join(k + '=' + str(v) for k, v in problems.items()),
+              '(' + str(integrity['kept']) + ' of ' + str(integrity['records']) + ' kept)')
+
+
+def output_names(loc):
+    """ Function to return the column names of the output files, legacy columns first. """
+    if loc == 'harv':
+        return names_harv_saved + spectral.COLUMNS + qc.COLUMNS
+    return names_cata_saved + spectral.COLUMNS + qc.COLUMNS
+
+
 def load_output(d, loc, outdir):
     """ Function to load output data. """
-    names_cata_saved = ['time', 'A1', 'A1_t1', 'A1_t2', 'B1', 'E1', 'F1', 'L1_1', 'L1_2', 'P6', 'U1',
-                        'W1', 'l', 'l_Hs', 'l_max', 'l_mean', 'l_median', 'l_min', 'l_n', 'l_rpw', 'l_skew', 'l_std']
-    names_harv_saved = ['time', 'D1', 'F1', 'L1_1', 'L1_2', 'N1_1', 'N1_1_ssh', 'N1_2', 'P6', 'U1', 'W1',
-                        'Y1_1', 'Y1_1_ssh', 'Y1_2', 'l', 'l_Hs', 'l_max', 'l_mean', 'l_median', 'l_min',
-                        'l_n', 'l_rpw', 'l_skew', 'l_ssh', 'l_std']
+    names = output_names(loc)
+    legacy = names_harv_saved if loc == 'harv' else names_cata_saved
     f = os.path.join(outdir, loc + '_' + d.strftime('%Y%m') + '.csv')
-    if loc == 'harv':
-        try:
-            filedata = pd.read_csv(f, header=0, usecols=range(0, 25), names=names_harv_saved, parse_dates=True,
-                                   index_col=0, na_values='   -   ')
-            return filedata
-        except IOError:
-            data = pd.DataFrame(columns=names_harv_saved)
-            data.set_index('time', inplace=True, drop=True)
-            return data
-    else:
-        try:
-            filedata = pd.read_csv(f, header=0, usecols=range(0, 22), names=names_cata_saved, parse_dates=True,
-                                   index_col=0, na_values='   -   ')
-            return filedata
-        except IOError:
-            data = pd.DataFrame(columns=names_cata_saved)
-            data.set_index('time', inplace=True, drop=True)
-            return data
+    try:
+        filedata = pd.read_csv(f, header=0, parse_dates=True, index_col=0, na_values='   -   ')
+    except IOError:
+        data = pd.DataFrame(columns=names)
+        data.set_index('time', inplace=True, drop=True)
+        return data
+    # Legacy columns are read by position, columns added since are read by name if present
+    extra = filedata.reindex(columns=names[len(legacy):])
+    filedata = filedata.iloc[:, :len(legacy) - 1]
+    filedata.columns = legacy[1:]
+    filedata.index.name = 'time'
+    return pd.concat([filedata, extra], axis=1)
 
 
 def load_coops(d, loc, coopsdir):
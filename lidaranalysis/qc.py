@@ -0,0 +1,146 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+############## Data Quality Flags #########################################################################
+COLUMNS = ['q_nraw', 'q_rej', 'q_gap', 'q_rate', 'q_dup', 'q_back', 'q_rpw_p05', 'q_rpw_p50', 'q_rpw_p95',
+           'q_flag']
+
+WINDOW = 360.0  # Length of each averaging window (s)
+GAP_MAX = 10.0  # Largest allowed time between samples (s)
+RATE_DEV = 0.2  # Largest allowed relative deviation of sample rate from the daily median
+REJ_MAX = 0.05  # Largest allowed fraction of points removed by the outlier filter
+RPW_MAD = 6.0  # Number of MADs the window median rpw may deviate from the daily median
+RPW_FRAC = 0.1  # Smallest deviation of the window median rpw from the daily median that is flagged
+
+# Bits of q_flag
+NO_DATA = 1
+GAP = 2
+RATE = 4
+DUPLICATE = 8
+NON_MONOTONIC = 16
+REJECTED = 32
+RPW = 64
+
+
+def members(t, starts, window=WINDOW):
+    """ Function to assign samples to the closed windows [start, start + window] they fall in.
+
+    Like the averaging, a sample on the boundary of two windows belongs to both. Returns the sample and
+    window index of every membership.
+    """
+    k = np.searchsorted(starts, t, side='right') - 1  # last window starting at or before each sample
+    idx = np.arange(len(t))
+    ind, win = [], []
+    for shift in (0, 1):  # the window itself and the previous window, whose end may reach the sample
+        kk = k - shift
+        ok = (kk >= 0) & (t <= starts[np.maximum(kk, 0)] + window)
+        ind.append(idx[ok])
+        win.append(kk[ok])
+    return np.concatenate(ind), np.concatenate(win)
+
+
+def windowstats(time, rpw, starts, backstep=None, window=WINDOW):
+    """ Function to compute timing and rpw metrics of every window in one pass over the raw data.
+
+    time and rpw are the raw samples, starts the sorted start times of the windows (s). backstep marks
+    samples whose time stepped backwards in the raw file; without it time is taken to be in file order.
+    Windows are the same closed intervals the averaging uses. Returns a dictionary of arrays of length
+    len(starts).
+    """
+    time = np.asarray(time, dtype=float)
+    rpw = np.asarray(rpw, dtype=float)
+    starts = np.asarray(starts, dtype=float)
+    nwin = len(starts)
+
+    # Timestamps stepping backwards in the file, counted in the windows of the later sample
+    ind, win = members(time, starts, window)
+    if backstep is None:
+        back = np.concatenate([[False], np.diff(time) < 0])
+    else:
+        back = np.asarray(backstep, dtype=bool)
+    q_back = np.bincount(win[back[ind]], minlength=nwin)
+
+    # Everything else works on the sorted time axis, ordered by window
+    srt = np.lexsort((time[ind], win))
+    t, p, k = time[ind][srt], rpw[ind][srt], win[srt]
+    n = np.bincount(k, minlength=nwin)
+
+    same = k[1:] == k[:-1]  # consecutive samples in the same window
+    step = np.diff(t)
+    q_dup = np.bincount(k[1:][same & (step == 0)], minlength=nwin)
+
+    # Largest gap, including the gaps to the edges of the window
+    q_gap = np.full(nwin, float(window))
+    has = n > 0
+    first = np.cumsum(n) - n  # index of first sample of each window
+    last = first + n - 1
+    q_gap[has] = np.maximum(t[first[has]] - starts[has], starts[has] + window - t[last[has]])
+    np.maximum.at(q_gap, k[1:][same], step[same])
+
+    # Sample rate relative to the median rate of the windows with data
+    rate = n / window
+    nominal = np.median(rate[has]) if has.any() else np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q_rate = rate / nominal - 1
+
+    # Nearest-rank rpw percentiles of each window
+    srt = np.lexsort((p, k))
+    out = {'q_gap': q_gap, 'q_rate': q_rate, 'q_dup': q_dup, 'q_back': q_back}
+    for name, frac in (('q_rpw_p05', 0.05), ('q_rpw_p50', 0.5), ('q_rpw_p95', 0.95)):
+        val = np.full(nwin, np.nan)
+        val[has] = p[srt][first[has] + np.floor(frac * (n[has] - 1)).astype(np.intp)]
+        out[name] = val
+    return out
+
+
+def flags(stats):
+    """ Function to combine the window metrics into the q_flag bitmask. """
+    flag = np.zeros(len(stats['q_gap']), dtype=int)
+    flag[stats['q_nraw'] == 0] |= NO_DATA
+    flag[stats['q_gap'] > GAP_MAX] |= GAP
+    flag[np.abs(stats['q_rate']) > RATE_DEV] |= RATE
+    flag[stats['q_dup'] > 0] |= DUPLICATE
+    flag[stats['q_back'] > 0] |= NON_MONOTONIC
+    flag[stats['q_rej'] > REJ_MAX] |= REJECTED
+    med = stats['q_rpw_p50']
+    if np.isfinite(med).any():
+        center = np.nanmedian(med)
+        mad = 1.4826 * np.nanmedian(np.abs(med - center))
+        tol = max(RPW_MAD * mad, RPW_FRAC * abs(center))
+        flag[np.abs(med - center) > tol] |= RPW
+    return flag
+
+
+def summary(stats, d):
+    """ Function to summarize the window metrics of one day into a single row DataFrame. """
+    flag = stats['q_flag']
+    has = stats['q_nraw'] > 0
+    row = {'windows': len(flag),
+           'flagged': int(np.count_nonzero(flag)),
+           'no_data': int(np.count_nonzero(flag & NO_DATA)),
+           'gap': int(np.count_nonzero(flag & GAP)),
+           'rate': int(np.count_nonzero(flag & RATE)),
+           'duplicate': int(np.count_nonzero(flag & DUPLICATE)),
+           'non_monotonic': int(np.count_nonzero(flag & NON_MONOTONIC)),
+           'rejected': int(np.count_nonzero(flag & REJECTED)),
+           'rpw': int(np.count_nonzero(flag & RPW)),
+           'max_gap': np.max(stats['q_gap']),
+           'mean_rej': np.mean(stats['q_rej'][has]) if has.any() else np.nan,
+           'rpw_p50': np.nanmedian(stats['q_rpw_p50']) if has.any() else np.nan}
+    data = pd.DataFrame([row], index=pd.DatetimeIndex([d], name='time'))
+    return data
+
+
+def write_summary(day, loc, outdir):
+    """ Function to merge a daily QC summary into the monthly QC file. """
+    d = day.index[0]
+    f = os.path.join(outdir, loc + '_qc_' + d.strftime('%Y%m') + '.csv')
+    if os.path.isfile(f):
+        data = pd.read_csv(f, header=0, parse_dates=True, index_col=0)
+        data = pd.concat([data[data.index != d], day]).sort_index()
+    else:
+        data = day
+    data.to_csv(f, na_rep='NaN')
+    print('Writing QC Summary to:', f)
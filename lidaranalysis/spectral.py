@@ -0,0 +1,78 @@
+import numpy as np
+
+
+############## Spectral Wave Statistics ###################################################################
+COLUMNS = ['l_Hm0', 'l_Tp', 'l_Tm01', 'l_Tm02', 'l_E_ig', 'l_E_swell', 'l_E_sea']
+
+FS = 2.0  # Rate of uniform grid raw data is averaged onto (Hz)
+WINDOW = 360.0  # Length of each averaging window (s)
+NPERSEG = 240  # Welch segment length in grid samples (120 s)
+MIN_COVERAGE = 0.9  # Fraction of grid bins that must contain data for a spectrum to be computed
+WAVE_BAND = (1 / 25., 1 / 2.)  # Frequency band (Hz) integrated for Hm0 and the mean periods
+BANDS = {'l_E_ig': (1 / 120., 1 / 25.),  # Infragravity, lowest nonzero bin of the 120 s segments
+         'l_E_swell': (1 / 25., 1 / 10.),  # Swell
+         'l_E_sea': (1 / 10., 1 / 2.)}  # Wind sea
+
+
+def resample(tw, r, w, nwin, fs=FS, window=WINDOW):
+    """ Function to bin-average the ranges of every window onto a uniform time grid.
+
+    tw is the time of each point from the start of its window (s), r the range and w the index of the
+    window the point belongs to. Returns an (nwin, window * fs) array with NaN in bins without data.
+    """
+    n = int(round(window * fs))
+    b = np.clip((np.asarray(tw) * fs).astype(np.intp), 0, n - 1)  # grid bin of each point
+    k = np.asarray(w, dtype=np.intp) * n + b  # flat index of bin over all windows
+    cnt = np.bincount(k, minlength=nwin * n)
+    tot = np.bincount(k, weights=r, minlength=nwin * n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid = tot / cnt
+    return grid.reshape(nwin, n)
+
+
+def welch(grid, fs=FS, nperseg=NPERSEG):
+    """ Function to compute the Welch power spectral density of every row with one batched FFT. """
+    starts = np.arange(0, grid.shape[1] - nperseg + 1, nperseg // 2)  # 50% overlapping segments
+    seg = grid[:, starts[:, None] + np.arange(nperseg)]  # (windows, segments, samples)
+    seg = seg - seg.mean(axis=-1, keepdims=True)
+    taper = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(nperseg) / nperseg)  # periodic Hann window
+    psd = np.abs(np.fft.rfft(seg * taper, axis=-1)) ** 2 / (fs * np.sum(taper ** 2))
+    psd[..., 1:] *= 2  # one-sided spectrum
+    if nperseg % 2 == 0:
+        psd[..., -1] /= 2  # Nyquist bin is not doubled
+    return np.fft.rfftfreq(nperseg, 1 / fs), psd.mean(axis=1)
+
+
+def wavestats(tw, r, w, nwin):
+    """ Function to compute spectral wave statistics for every six minute window.
+
+    Returns a dictionary of arrays of length nwin keyed by the names in COLUMNS. Windows with less than
+    MIN_COVERAGE of the grid filled are NaN.
+    """
+    grid = resample(tw, r, w, nwin)
+    good = np.isfinite(grid)
+    coverage = good.mean(axis=1)
+    cnt = np.maximum(good.sum(axis=1, keepdims=True), 1)
+    fill = np.where(good, grid, 0).sum(axis=1, keepdims=True) / cnt
+    grid = np.where(good, grid, fill)  # fill gaps with the window mean
+
+    f, psd = welch(grid)
+    df = f[1] - f[0]
+    band = (f >= WAVE_BAND[0]) & (f < WAVE_BAND[1])
+    s, fb = psd[:, band], f[band]
+    m0 = s.sum(axis=1) * df
+    m1 = (s * fb).sum(axis=1) * df
+    m2 = (s * fb ** 2).sum(axis=1) * df
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = {'l_Hm0': 4 * np.sqrt(m0),
+               'l_Tp': 1 / fb[np.argmax(s, axis=1)],
+               'l_Tm01': m0 / m1,
+               'l_Tm02': np.sqrt(m0 / m2)}
+    for name, (lo, hi) in BANDS.items():
+        out[name] = psd[:, (f >= lo) & (f < hi)].sum(axis=1) * df
+
+    bad = (coverage < MIN_COVERAGE) | (m0 <= 0)
+    for name in out:
+        out[name] = np.where(bad, np.nan, out[name])
+    return out
@@ -0,0 +1,173 @@
+import datetime as dt
+import os
+import socket
+import time
+
+
+############## File Based Work Queue #######################################################################
+# A queue directory holds one empty file per (station, day) task, named 'loc_YYYYMMDD'. A task is
+# claimed by renaming it from pending/ to claimed/, which is atomic on a shared filesystem, so any number
+# of workers on any number of hosts can take tasks without a scheduler. Results are written as per-day
+# shards and merged into the monthly products afterwards.
+STATES = ['pending', 'claimed', 'done', 'failed']
+TIMEOUT = 2 * 60 * 60  # Seconds after which a claim is considered stale
+POLL = 30  # Seconds between checks for reclaimable tasks while other workers are busy
+
+
+def task_name(loc, d):
+    """ Function to create the name of a task. """
+    return loc + '_' + d.strftime('%Y%m%d')
+
+
+def parse_task(name):
+    """ Function to return the location and date of a task. """
+    loc, day = name.split('_')
+    return loc, dt.datetime.strptime(day, '%Y%m%d')
+
+
+def init_queue(qdir):
+    """ Function to create the directories of a queue. """
+    for s in STATES + ['shards']:
+        os.makedirs(os.path.join(qdir, s), exist_ok=True)
+
+
+def enqueue(qdir, locs, start, end):
+    """ Function for writing a manifest of (station, day) tasks into the queue directory. """
+    init_queue(qdir)
+    existing = set()
+    for s in STATES:
+        existing.update(os.listdir(os.path.join(qdir, s)))
+    added = 0
+    with open(os.path.join(qdir, 'manifest.txt'), 'a') as manifest:
+        for loc in locs:
+            d = start
+            while d <= end:
+                name = task_name(loc, d)
+                if name not in existing:
+                    open(os.path.join(qdir, 'pending', name), 'w').close()
+                    manifest.write(name + '\n')
+                    added += 1
+                d = d + dt.timedelta(days=1)
+    print('Tasks Added:     ', added)
+    status(qdir)
+
+
+def status(qdir):
+    """ Function to print the number of tasks in each state. """
+    for s in STATES:
+        print((s.capitalize() + ':').ljust(17), len(os.listdir(os.path.join(qdir, s))))
+
+
+def reclaim(qdir, timeout=TIMEOUT):
+    """ Function to return claims older than timeout to the pending tasks. """
+    now = time.time()
+    for name in os.listdir(os.path.join(qdir, 'claimed')):
+        f = os.path.join(qdir, 'claimed', name)
+        try:
+            if now - os.path.getmtime(f) > timeout:
+                os.rename(f, os.path.join(qdir, 'pending', name))
+                print('Reclaimed Stale Task:', name)
+        except OSError:  # finished or reclaimed by another worker
+            pass
+
+
+def claim(qdir):
+    """ Function to claim a pending task. Returns None if no task could be claimed. """
+    for name in sorted(os.listdir(os.path.join(qdir, 'pending'))):
+        f = os.path.join(qdir, 'claimed', name)
+        try:
+            os.utime(os.path.join(qdir, 'pending', name))  # claim time, so the claim is not seen as stale
+            os.rename(os.path.join(qdir, 'pending', name), f)
+        except OSError:  # claimed by another worker
+            continue
+        with open(f, 'w') as owner:
+            owner.write(socket.gethostname() + ' ' + str(os.getpid()))
+        return name
+    return None
+
+
+def finish(qdir, name, state):
+    """ Function to move a claimed task to the done or failed state. """
+    try:
+        os.rename(os.path.join(qdir, 'claimed', name), os.path.join(qdir, state, name))
+    except OSError:  # reclaimed while running, the task will be run again
+        print('Task', name, 'was reclaimed before finishing.')
+
+
+def write_shard(df, f):
+    """ Function to write a shard so that it only appears once it is complete. """
+    tmp = f + '.' + socket.gethostname() + '.' + str(os.getpid())
+    df.to_csv(tmp, na_rep='NaN')
+    os.replace(tmp, f)
+
+
+def run_task(qdir, name, datafile, outdir=None):
+    """ Function to average a single (station, day) task and write its result shards. """
+    from . import avg, loading  # imported here so filling the queue does not load pandas
+    loc, d = parse_task(name)
+    rawdir = os.path.join(datafile, loc, 'uls')
+    coopsdir = os.path.join(datafile, loc, 'co-ops')
+    req_filedir = os.path.join(datafile, 'lidar_analysis_files')
+    outdir = outdir if outdir is not None else os.path.join(datafile, loc, 'six_minute')
+    month = loading.load_output(d, loc, outdir)
+    ind = (month.index >= d) & (month.index < d + dt.timedelta(days=1))
+    # Only this day's rows, so its co-ops columns are used and only this day is made
+    day = avg.LidarData(d, loc, rawdir, None, coopsdir, None, req_filedir, dataMonth=month[ind])
+    if day.mark:
+        ind = (day.data.index >= d) & (day.data.index < d + dt.timedelta(days=1))
+        write_shard(day.data[ind], os.path.join(qdir, 'shards', name + '.csv'))
+        write_shard(day.qc_day, os.path.join(qdir, 'shards', name + '_qc.csv'))
+
+
+def worker(qdir, datafile, outdir=None, timeout=TIMEOUT, poll=POLL):
+    """ Function for claiming and running tasks until the queue is empty. """
+    init_queue(qdir)
+    while True:
+        reclaim(qdir, timeout)
+        name = claim(qdir)
+        if name is None:
+            if not os.listdir(os.path.join(qdir, 'claimed')):
+                break
+            time.sleep(poll)  # other workers are busy, wait in case their claims go stale
+            continue
+        print('Claimed Task:    ', name)
+        try:
+            run_task(qdir, name, datafile, outdir)
+        except (Exception, SystemExit) as e:
+            print('Task', name, 'failed:', repr(e))
+            finish(qdir, name, 'failed')
+            continue
+        finish(qdir, name, 'done')
+    print('-------------------------------------')
+    print('Queue is empty.')
+    status(qdir)
+
+
+def merge(qdir, locs, datafile, outdir=None):
+    """ Function for assembling the per-day shards into the monthly products. """
+    import pandas as pd
+    from . import loading, qc
+    shards = sorted(f for f in os.listdir(os.path.join(qdir, 'shards')) if f.endswith('.csv')
+                    and not f.endswith('_qc.csv'))
+    for loc in locs:
+        out = outdir if outdir is not None else os.path.join(datafile, loc, 'six_minute')
+        names = [f[:-4] for f in shards if f.startswith(loc + '_')]
+        months = sorted(set(n[:-2] for n in names))
+        for month in months:
+            d = parse_task(month + '01')[1]
+            data = loading.load_output(d, loc, out)
+            for name in [n for n in names if n.startswith(month)]:
+                shard = pd.read_csv(os.path.join(qdir, 'shards', name + '.csv'), header=0, parse_dates=True,
+                                    index_col=0)
+                cols = [c for c in shard.columns if c.startswith('l') or c.startswith('q_')
+                        or c.endswith('_ssh')]  # LiDAR columns and those derived with them
+                data = data.reindex(data.index.union(shard.index))
+                data.loc[shard.index, cols] = shard[cols]
+                qc.write_summary(pd.read_csv(os.path.join(qdir, 'shards', name + '_qc.csv'), header=0,
+                                             parse_dates=True, index_col=0), loc, out)
+            f = os.path.join(out, loc + '_' + d.strftime('%Y%m') + '.csv')
+            data.index.name = 'time'
+            data.to_csv(f, na_rep='NaN')
+            print('Writing Data to:', f)
+    print('-------------------------------------')
+    status(qdir)
@@ -29,7 +29,6 @@ setup(
     install_requires=[
         "numpy",
         "pandas",
-        "scipy",
         "matplotlib",
         "python-dateutil",
     ],
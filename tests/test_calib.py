@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from lidaranalysis import calib
+
+
+def month(start, diff, noise=0., n=240):
+    """ Six minute cata data of a month where l_mean - A1 is diff plus alternating noise. """
+    index = pd.date_range(start, periods=n, freq='6min')
+    d = diff + noise * np.where(np.arange(n) % 2, 1., -1.)
+    return pd.DataFrame({'l_mean': 10. + d, 'A1': 10.}, index=index)
+
+
+def table(*months, method='rolling'):
+    stats = pd.concat([calib.month_stats(m, 'cata') for m in months]).sort_index()
+    return calib.derive(stats, method)
+
+
+def test_rolling_does_not_join_months_across_a_gap():
+    t = table(month('2019-01-01', 1.), month('2019-02-01', 2.), month('2019-04-01', 4.))
+    assert list(t.index) == ['201901', '201902', '201904']
+    assert np.allclose(t['rolling'], [1.5, 1.5, 4.])  # 201903 has no data, 201904 stands alone
+    assert np.allclose(t['bias'], t['rolling'])
+    assert np.isclose(t['global'].iloc[0], 7 / 3.)
+
+
+def test_monthly_skips_noisy_months():
+    t = table(month('2019-01-01', 1., 0.01), month('2019-02-01', 2., 0.01), month('2019-03-01', 3., 1.),
+              method='monthly')
+    assert np.allclose(t['monthly'].iloc[:2], [1., 2.])
+    assert np.isnan(t['monthly'].iloc[2])
+    assert np.isnan(t['bias'].iloc[2])
+
+
+def test_derive_empty():
+    t = table(month('2019-01-01', 1.).assign(A1=np.nan))
+    assert t.empty
+    assert 'bias' in t
+
+
+def test_update_and_lookup(tmp_path):
+    req = str(tmp_path)
+    assert calib.update(month('2019-01-01', 1.), 'cata', req) is None  # no table, nothing to update
+    assert calib.lookup(pd.DatetimeIndex(['2019-01-10']), 'cata', req) is None
+
+    calib.write_table(table(month('2019-01-01', 1.), month('2019-02-01', 2.), month('2019-03-01', 3.),
+                            method='monthly'), 'cata', req)
+    t = calib.update(month('2019-02-01', 5.), 'cata', req)  # replaces February
+    assert list(t.index) == ['201901', '201902', '201903']
+    assert t['method'].iloc[0] == 'monthly'
+    assert np.allclose(t['bias'], [1., 5., 3.])
+
+    mid = pd.Timestamp(calib.EPOCH) + pd.to_timedelta(t['t_mid'] * 365.25 * 86400, unit='s')
+    times = pd.DatetimeIndex([mid.iloc[0] - pd.Timedelta(days=30), mid.iloc[1], mid.iloc[2] + pd.Timedelta(days=30)])
+    assert np.allclose(calib.lookup(times, 'cata', req), [1., 5., 3.])  # held beyond the first and last month
+
+
+def test_lookup_drift(tmp_path):
+    req = str(tmp_path)
+    calib.write_table(table(month('2019-01-01', 1.), month('2019-02-01', 2.), month('2019-03-01', 3.),
+                            method='drift'), 'cata', req)
+    t = calib.read_table('cata', req)
+    intercept, slope = calib.drift(t)
+    assert slope > 0
+    times = pd.DatetimeIndex(['2018-01-01', '2020-01-01'])
+    assert np.allclose(calib.lookup(times, 'cata', req), intercept + slope * calib.years(times))
@@ -0,0 +1,58 @@
+import numpy as np
+from lidaranalysis import loading
+
+DTYPE = np.dtype([('time', np.uint32), ('range', np.uint32), ('rpw', np.uint32)])
+
+
+def records(time, rng, rpw=None):
+    rec = np.zeros(len(time), dtype=DTYPE)
+    rec['time'] = time
+    rec['range'] = rng
+    rec['rpw'] = 15000 if rpw is None else rpw
+    return rec.tobytes()
+
+
+def test_decode_empty():
+    data = loading.decode(b'', DTYPE)
+    assert len(data) == 0
+    assert list(data.columns) == ['range', 'rpw', 'backstep']
+    assert data.attrs['integrity']['records'] == 0
+    assert data.attrs['integrity']['kept'] == 0
+
+
+def test_decode_partial_bytes_only():
+    data = loading.decode(b'\x01' * 7, DTYPE)
+    assert len(data) == 0
+    assert data.attrs['integrity']['partial_bytes'] == 7
+
+
+def test_decode_partial_record_dropped():
+    data = loading.decode(records([10, 20], [12000, 12100]) + b'\x01' * 5, DTYPE)
+    assert list(data['range']) == [12.0, 12.1]
+    assert data.attrs['integrity']['partial_bytes'] == 5
+
+
+def test_decode_all_bad_ranges():
+    data = loading.decode(records([10, 20, 30], [0, 0, loading.MAX_RANGE + 1]), DTYPE)
+    assert len(data) == 0
+    assert data.attrs['integrity']['bad_range'] == 3
+    assert data.attrs['integrity']['kept'] == 0
+
+
+def test_decode_unsorted_with_duplicates():
+    # 30 steps back to 20 and the block 20, 30 is repeated
+    data = loading.decode(records([10, 30, 20, 30, 20, 30, 40], [1000, 3000, 2000, 3000, 2000, 3000, 4000]), DTYPE)
+    integrity = data.attrs['integrity']
+    assert list(data.index) == [0.001, 0.002, 0.003, 0.004]
+    assert list(data['range']) == [1.0, 2.0, 3.0, 4.0]
+    assert list(data['backstep']) == [False, True, False, False]
+    assert integrity['unsorted'] == 2
+    assert integrity['duplicates'] == 3
+    assert integrity['kept'] == 4
+    assert integrity['wraps'] == 0
+
+
+def test_decode_large_backward_jump_not_shifted():
+    data = loading.decode(records([2 ** 32 - 10, 5], [1000, 2000]), DTYPE)
+    assert data.attrs['integrity']['wraps'] == 1
+    assert list(data.index) == [0.0005, (2 ** 32 - 10) / 10000]
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ['numpy', 'pandas', 'matplotlib', 'scipy', 'dateutil']
+BUDGET = 1.0  # Seconds allowed for a whole -u or -c invocation, including interpreter startup
+
+# Runs the command line tool in a fresh interpreter and prints the heavy modules it imported
+DRIVER = """
+import sys
+from lidaranalysis._main import main
+sys.argv = ['lidar-analysis'] + sys.argv[1:]
+try:
+    main()
+except SystemExit:
+    pass
+print('HEAVY:' + ' '.join(m for m in {heavy!r} if m in sys.modules))
+""".format(heavy=HEAVY)
+
+
+@pytest.fixture
+def datafile(tmp_path):
+    os.makedirs(os.path.join(str(tmp_path), 'lidar_analysis_files'))
+    return str(tmp_path)
+
+
+def run(datafile, *args):
+    env = dict(os.environ, LIDARDATAFILE=datafile, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', DRIVER] + list(args), env=env, cwd=ROOT,
+                         stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    elapsed = time.perf_counter() - start
+    heavy = [line[len('HEAVY:'):] for line in out.stdout.splitlines() if line.startswith('HEAVY:')]
+    return heavy[0].split(), elapsed
+
+
+@pytest.mark.parametrize('args, name, value', [
+    (['-l', 'harv', '-u', '20190601'], 'lidar_analysis_files/lastday_harv.txt', '20190601'),
+    (['-l', 'cata', '-c', '201905'], 'lidar_analysis_files/lastcoopsmonth_cata.txt', '201905'),
+    (['-l', 'harv', '--enqueue', '{datafile}/queue', '-s', '20190601', '-e', '20190602'],
+     'queue/pending/harv_20190602', ''),
+])
+def test_quick_options_start_fast(datafile, args, name, value):
+    args = [a.format(datafile=datafile) for a in args]
+    run(datafile, *args)  # warm the bytecode cache
+    heavy, elapsed = run(datafile, *args)
+    with open(os.path.join(datafile, name)) as f:
+        assert f.read() == value
+    assert heavy == []
+    assert elapsed < BUDGET, 'took %.2f s' % elapsed